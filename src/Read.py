@@ -7,105 +7,419 @@ Enhanced RFID Musical Box with Rotary Encoder Volume Control - FIXED VERSION
 - RFID tag detection for song selection
 - Supports both WAV and MP3 files
 - Proper GPIO mode configuration and shutdown handling
+- Encoder edges via the pigpio daemon (pigpiod must be running)
 """
 import time
 from time import sleep
 import pygame
 import sys
-import RPi.GPIO as GPIO
-from mfrc522 import SimpleMFRC522
+import pigpio
+import RPi.GPIO as GPIO  # still used by mfrc522 for the reader's RST pin
+from mfrc522 import MFRC522
 import re
 import os
+import functools
+import argparse
+import atexit
+import collections
+import io
+import logging
+import logging.handlers
+import queue
 import signal
 import threading
 
+# Also log per-event diagnostics (rotations, button, pin states);
+# MUSICBOX_DEBUG=1 is the same as passing --verbose
+DEBUG = bool(int(os.environ.get("MUSICBOX_DEBUG", "0")))
+
+# Full log on tmpfs (RuntimeDirectory= in the service) so hot-path logging
+# never waits on the SD card or the journal; stdout only gets warnings
+LOG_PATH = os.environ.get("MUSICBOX_LOG", "/run/musicbox/musicbox.log")
+
+log = logging.getLogger("musicbox")
+
+# Audio files and startup.mp3 live next to this script. Absolute, so the
+# service's WorkingDirectory= doesn't matter
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Core the encoder callback thread is pinned to. Reserve it with isolcpus=3
+# in /boot/firmware/cmdline.txt; ignored on single-core boards.
+ENCODER_CPU = int(os.environ.get("ENCODER_CPU", 3))
+
+# SPI clock for the RFID reader. mfrc522 opens spidev at 1 MHz; the MFRC522
+# is rated for 10 MHz. 8 MHz is tried first and checked at startup; long
+# jumper wires that garble it drop back to 4 MHz.
+RFID_SPI_HZ = int(os.environ.get("RFID_SPI_HZ", 8_000_000))
+RFID_SPI_FALLBACK_HZ = 4_000_000
+
+# BCM pin wired to the reader's IRQ output, if any (e.g. RFID_IRQ_PIN=24).
+# Without it, command completion is polled over SPI at 1 kHz.
+RFID_IRQ_PIN = int(os.environ.get("RFID_IRQ_PIN", 0)) or None
+
+# Mixer buffer in samples per channel. 4096 at 44.1 kHz (~93 ms) keeps ALSA
+# from underrunning on the Pi Zero 2 W while the knob is spun, and the delay
+# is unnoticeable for card taps. 2048 or 1024 respond faster but pop more.
+MIXER_BUFFER = int(os.environ.get("MIXER_BUFFER", 4096))
+
+# Recently played tracks are kept in RAM (still encoded) so a reinsert does
+# not wait on the SD card, and playback never reads from it mid-track.
+# A track's first play streams from disk while a thread reads it in;
+# files larger than the budget are never cached.
+MUSIC_CACHE_TRACKS = 8
+MUSIC_CACHE_BYTES = int(os.environ.get("MUSIC_CACHE_MB", 64)) * 1024 * 1024
+
+# Posted by SDL_mixer whenever the music stream stops
+MUSIC_END = pygame.USEREVENT + 1
+
+# Characters stripped from card text to get a track name
+_TRACK_RE = re.compile(r"[^A-Za-z0-9_-]")
+
+def _make_realtime(tid, cpu, priority=50):
+    """Pin thread ``tid`` to ``cpu`` and run it SCHED_FIFO; best effort.
+
+    SCHED_FIFO needs CAP_SYS_NICE or an RLIMIT_RTPRIO allowance
+    (LimitRTPRIO= in the service); without it the thread keeps its
+    default policy.
+    """
+    try:
+        if cpu < os.cpu_count():
+            os.sched_setaffinity(tid, {cpu})
+        os.sched_setscheduler(tid, os.SCHED_FIFO, os.sched_param(priority))
+        return True
+    except (OSError, AttributeError) as e:
+        log.warning(f"⚠️ Could not make encoder thread realtime: {e}")
+        return False
+
+def _build_step_table(table):
+    """Fold pin tracking into the decoder table so an edge is one lookup.
+
+    Index: (decoder state << 4) | (pins << 2) | (is_clk << 1) | level.
+    Entry: (next decoder state << 2) | next pins, plus 0x20 / 0x40 when
+    that edge completes a clockwise / counter-clockwise detent.
+    """
+    step = bytearray(len(table) * 4)
+    for state in range(len(table) // 4):
+        for pins in range(4):
+            for edge in range(4):
+                bit = 2 if edge & 2 else 1
+                new_pins = (pins | bit) if edge & 1 else (pins & ~bit)
+                nxt = table[(state << 2) | new_pins]
+                step[(state << 4) | (pins << 2) | edge] = ((nxt & 0x0F) << 2) | new_pins | ((nxt >> 4) << 5)
+    return bytes(step)
+
 class RotaryEncoder:
-    def __init__(self, clk_pin, dt_pin, sw_pin):
-        """Initialize rotary encoder with BCM GPIO numbers"""
+    # Full-step quadrature decoder (Ben Buxton's state table). Each row is a
+    # decoder state, each column the pin state (CLK << 1) | DT; 0x10 / 0x20
+    # mark a completed clockwise / counter-clockwise detent. Bounce and
+    # invalid transitions just walk back towards the start state.
+    _TABLE = bytes([
+        0x00, 0x02, 0x04, 0x00,  # start
+        0x03, 0x00, 0x01, 0x10,  # cw final
+        0x03, 0x02, 0x00, 0x00,  # cw begin
+        0x03, 0x02, 0x01, 0x00,  # cw next
+        0x06, 0x00, 0x04, 0x00,  # ccw begin
+        0x06, 0x05, 0x00, 0x20,  # ccw final
+        0x06, 0x05, 0x04, 0x00,  # ccw next
+    ])
+    _STEP = _build_step_table(_TABLE)
+    _DIRECTION = (0, 1, -1)  # indexed by step entry >> 5
+
+    # Fixed attribute set: the edge callback's state / edge_bits / events
+    # reads are slot loads rather than instance-dict lookups
+    __slots__ = (
+        "pi", "events", "clk_pin", "dt_pin", "sw_pin",
+        "rotation_counter", "debug", "sw_level", "state", "edge_bits",
+        "clk_cb", "dt_cb", "sw_cb",
+    )
+
+    def __init__(self, pi, events, clk_pin, dt_pin, sw_pin):
+        """Initialize rotary encoder with BCM GPIO numbers on a pigpio connection
+
+        Edge callbacks run on pigpio's notification thread and post to
+        ``events`` as ("rot", (1 / -1, tick)) and ("btn", None), so no
+        transition is lost while the main loop is busy elsewhere. Ticks are
+        pigpiod's edge timestamps in microseconds.
+        """
+        self.pi = pi
+        self.events = events
         self.clk_pin = clk_pin  # GPIO 26
         self.dt_pin = dt_pin    # GPIO 16
         self.sw_pin = sw_pin    # GPIO 13
         
         # Set up GPIO pins with proper pull-ups
-        GPIO.setup(self.clk_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        GPIO.setup(self.dt_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        GPIO.setup(self.sw_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        
-        # Track previous states
-        self.clk_last_state = GPIO.input(self.clk_pin)
-        self.dt_last_state = GPIO.input(self.dt_pin)
-        self.sw_last_state = GPIO.input(self.sw_pin)
-        
-        self.last_button_time = 0
-        self.last_rotation_time = 0
+        for pin in (self.clk_pin, self.dt_pin, self.sw_pin):
+            self.pi.set_mode(pin, pigpio.INPUT)
+            self.pi.set_pull_up_down(pin, pigpio.PUD_UP)
+
+        # pigpiod only reports a level once it has been stable this long (us),
+        # which filters contact bounce before it ever reaches Python. 30 ms
+        # on the switch covers its worst bounce, so every reported falling
+        # edge is a real press and needs no lockout here
+        self.pi.set_glitch_filter(self.clk_pin, 1000)
+        self.pi.set_glitch_filter(self.dt_pin, 1000)
+        self.pi.set_glitch_filter(self.sw_pin, 30000)
+
         self.rotation_counter = 0
-        
+        # Checked once here: the callbacks skip per-detent logging entirely
+        self.debug = log.isEnabledFor(logging.DEBUG)
+
         # Wait a moment for pins to stabilize
         time.sleep(0.1)
-        
-        print(f"🔧 Encoder setup - CLK: GPIO{self.clk_pin}, DT: GPIO{self.dt_pin}, SW: GPIO{self.sw_pin}")
-        print(f"🔧 Initial states - CLK: {self.clk_last_state}, DT: {self.dt_last_state}, SW: {self.sw_last_state}")
-    
-    def check_rotation(self):
-        """Check for encoder rotation and return direction (1, -1, or 0)"""
-        current_time = time.time()
-        
-        # Read current states
-        clk_state = GPIO.input(self.clk_pin)
-        dt_state = GPIO.input(self.dt_pin)
-        
-        # Check if CLK pin has changed (falling edge detection)
-        if clk_state != self.clk_last_state and clk_state == 0:  # Falling edge
-            # Debounce check
-            if current_time - self.last_rotation_time > 0.005:
-                # Determine direction based on DT state when CLK goes low
-                if dt_state == 0:
-                    direction = -1   # Counter-clockwise
-                else:
-                    direction = 1  # Clockwise
-                
-                self.last_rotation_time = current_time
+
+        # One GPLEV0 read seeds all three levels; from here on they are
+        # tracked from the callbacks, so nothing reads a pin on the hot path.
+        # state is (decoder state << 2) | (CLK << 1) | DT
+        levels = self.pi.read_bank_1()
+        clk = (levels >> self.clk_pin) & 1
+        dt = (levels >> self.dt_pin) & 1
+        self.sw_level = (levels >> self.sw_pin) & 1
+        self.state = (clk << 1) | dt
+        self.edge_bits = {self.clk_pin: 2, self.dt_pin: 0}
+
+        self.clk_cb = self.pi.callback(self.clk_pin, pigpio.EITHER_EDGE, self._on_edge)
+        self.dt_cb = self.pi.callback(self.dt_pin, pigpio.EITHER_EDGE, self._on_edge)
+        self.sw_cb = self.pi.callback(self.sw_pin, pigpio.EITHER_EDGE, self._on_button)
+
+        # All callbacks run on pigpio's notification thread; keep it off the
+        # cores SDL's mixer thread and the RFID poller compete for
+        notify = getattr(self.pi, "_notify", None)
+        if getattr(notify, "native_id", None):
+            _make_realtime(notify.native_id, ENCODER_CPU)
+
+        log.info(f"🔧 Encoder setup - CLK: GPIO{self.clk_pin}, DT: GPIO{self.dt_pin}, SW: GPIO{self.sw_pin}")
+        log.debug("🔧 Initial states - CLK: %d, DT: %d, SW: %d", clk, dt, self.sw_level)
+
+    def _on_edge(self, gpio, level, tick):
+        """CLK or DT edge: advance the decoder, queue (direction, tick) per detent"""
+        if level > 1:  # watchdog timeout, not an edge
+            return
+        step = self._STEP[(self.state << 2) | self.edge_bits[gpio] | level]
+        self.state = step & 0x1F
+        direction = self._DIRECTION[step >> 5]
+        if direction:
+            if self.debug:
                 self.rotation_counter += 1
-                
-                print(f"🔄 Rotation #{self.rotation_counter}: {direction} (CLK: {clk_state}, DT: {dt_state})")
-                
-                # Update states
-                self.clk_last_state = clk_state
-                self.dt_last_state = dt_state
-                return direction
-        
-        # Update states even if no rotation detected
-        self.clk_last_state = clk_state
-        self.dt_last_state = dt_state
-        return 0
-    
-    def check_button(self):
-        """Check for button press and return True if pressed"""
-        current_time = time.time()
-        sw_state = GPIO.input(self.sw_pin)
-        
-        # Detect falling edge (button press)
-        if sw_state == 0 and self.sw_last_state == 1:
-            # Debounce check
-            if current_time - self.last_button_time > 0.3:
-                self.last_button_time = current_time
-                self.sw_last_state = sw_state
-                print("🔘 Button pressed!")
-                return True
-        
-        self.sw_last_state = sw_state
-        return False
+                log.debug("🔄 Rotation #%d: %d", self.rotation_counter, direction)
+            self.events.put(("rot", (direction, tick)))
+
+    def _on_button(self, gpio, level, tick):
+        """Button edge (already debounced by pigpiod): track the level, post presses"""
+        if level > 1:  # watchdog timeout, not an edge
+            return
+        self.sw_level = level
+        if level:
+            return
+        if self.debug:
+            log.debug("🔘 Button pressed!")
+        self.events.put(("btn", None))
 
     def is_pressed(self):
-        return GPIO.input(self.sw_pin) == 0
+        return self.sw_level == 0
+
+    def cleanup(self):
+        """Cancel edge callbacks and release the glitch filters"""
+        for cb in (self.clk_cb, self.dt_cb, self.sw_cb):
+            cb.cancel()
+        for pin in (self.clk_pin, self.dt_pin, self.sw_pin):
+            self.pi.set_glitch_filter(pin, 0)
+
+class FastMFRC522(MFRC522):
+    """MFRC522 whose command wait ends on the chip's interrupt flags.
+
+    mfrc522's own wait loop reads CommIrqReg back to back, up to 2000 SPI
+    transfers per command, and does not stop on the timer interrupt, so
+    every "no card" poll spins until the loop runs out. Here the wait
+    stops on the receive/idle flags or the chip's ~15 ms receive timeout.
+    With ``irq`` (an Event set by the IRQ pin's falling edge) it sleeps
+    until the chip signals; otherwise it checks the register once per ms.
+    """
+
+    WAIT_TIMEOUT = 0.05  # seconds; well past the chip's own receive timeout
+
+    def __init__(self, irq=None, **kwargs):
+        self.irq = irq
+        super().__init__(**kwargs)
+        if self.irq is not None:
+            self.Write_MFRC522(self.DivlEnReg, 0x80)  # IRQ pin as CMOS output
+
+    def _wait_irq(self, mask):
+        """Return CommIrqReg once any bit in ``mask`` is set, or None on timeout"""
+        deadline = time.monotonic() + self.WAIT_TIMEOUT
+        while True:
+            if self.irq is not None:
+                self.irq.wait(max(0.0, deadline - time.monotonic()))
+                self.irq.clear()
+            else:
+                time.sleep(0.001)
+            n = self.Read_MFRC522(self.CommIrqReg)
+            if n & mask:
+                return n
+            if time.monotonic() >= deadline:
+                return None
+
+    def MFRC522_ToCard(self, command, sendData):
+        if command == self.PCD_AUTHENT:
+            irq_en, mask = 0x12, 0x10            # IdleIRq
+        elif command == self.PCD_TRANSCEIVE:
+            irq_en, mask = 0x77, 0x31            # RxIRq, IdleIRq, TimerIRq
+        else:
+            return (self.MI_ERR, [], 0)
+        if self.irq is not None:
+            irq_en = mask                        # only assert IRQ for what we wait on
+
+        self.Write_MFRC522(self.CommIEnReg, irq_en | 0x80)  # IRqInv: IRQ active low
+        self.ClearBitMask(self.CommIrqReg, 0x80)
+        self.SetBitMask(self.FIFOLevelReg, 0x80)
+        self.Write_MFRC522(self.CommandReg, self.PCD_IDLE)
+        for byte in sendData:
+            self.Write_MFRC522(self.FIFODataReg, byte)
+        if self.irq is not None:
+            self.irq.clear()
+        self.Write_MFRC522(self.CommandReg, command)
+        if command == self.PCD_TRANSCEIVE:
+            self.SetBitMask(self.BitFramingReg, 0x80)  # StartSend
+
+        n = self._wait_irq(mask)
+        self.ClearBitMask(self.BitFramingReg, 0x80)
+        if n is None or self.Read_MFRC522(self.ErrorReg) & 0x1B:
+            return (self.MI_ERR, [], 0)
+        if n & 0x01 and command == self.PCD_TRANSCEIVE:
+            return (self.MI_NOTAGERR, [], 0)
+
+        back_data = []
+        back_len = 0
+        if command == self.PCD_TRANSCEIVE:
+            level = self.Read_MFRC522(self.FIFOLevelReg)
+            last_bits = self.Read_MFRC522(self.ControlReg) & 0x07
+            back_len = (level - 1) * 8 + last_bits if last_bits else level * 8
+            for _ in range(min(max(level, 1), self.MAX_LEN)):
+                back_data.append(self.Read_MFRC522(self.FIFODataReg))
+        return (self.MI_OK, back_data, back_len)
+
+    def MFRC522_Halt(self):
+        """Send HLTA; a halted card answers only WUPA (PICC_REQALL)"""
+        buf = [self.PICC_HALT, 0]
+        buf += self.CalulateCRC(buf)
+        self.MFRC522_ToCard(self.PCD_TRANSCEIVE, buf)  # no reply expected
+
+class RfidReader:
+    """Card reads on one shared FastMFRC522 (``self.mfrc``)
+
+    Replaces SimpleMFRC522, whose read path runs select, auth and the
+    block reads on every call even when only the UID is needed. Ids,
+    key and text blocks match SimpleMFRC522's, so cards written with
+    write.py read the same.
+    """
+
+    KEY = [0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF]
+    BLOCK_ADDRS = [8, 9, 10]
+    VERSION_REG = 0x37  # chip version, 0x91 / 0x92 on genuine MFRC522s
+
+    def __init__(self, irq=None):
+        self.mfrc = FastMFRC522(irq=irq)
+
+    @staticmethod
+    def uid_to_num(uid):
+        n = 0
+        for i in range(0, 5):
+            n = n * 256 + uid[i]
+        return n
+
+    def set_spi_speed(self, *speeds):
+        """Use the first SPI clock in ``speeds`` that reads back cleanly
+
+        VersionReg is read once at the current (slow) clock and then
+        repeatedly at each candidate; a single mismatch rejects it.
+        Returns the clock in use.
+        """
+        mfrc = self.mfrc
+        spi = mfrc.spi
+        default_hz = spi.max_speed_hz
+        expected = mfrc.Read_MFRC522(self.VERSION_REG)
+        for hz in speeds:
+            spi.max_speed_hz = hz
+            if all(mfrc.Read_MFRC522(self.VERSION_REG) == expected for _ in range(32)):
+                return hz
+        spi.max_speed_hz = default_hz
+        return default_hz
+
+    def _probe_uid(self):
+        """WUPA + anticollision: the raw UID bytes in the field, or None"""
+        mfrc = self.mfrc
+        status, _ = mfrc.MFRC522_Request(mfrc.PICC_REQALL)
+        if status != mfrc.MI_OK:
+            return None
+        status, uid = mfrc.MFRC522_Anticoll()
+        return uid if status == mfrc.MI_OK else None
+
+    def _read_text(self, uid):
+        """Select the probed card and read its text blocks"""
+        mfrc = self.mfrc
+        mfrc.MFRC522_SelectTag(uid)
+        status = mfrc.MFRC522_Auth(mfrc.PICC_AUTHENT1A, 11, self.KEY, uid)
+        data = []
+        if status == mfrc.MI_OK:
+            for block_num in self.BLOCK_ADDRS:
+                block = mfrc.MFRC522_Read(block_num)
+                if block:
+                    data += block
+        mfrc.MFRC522_StopCrypto1()
+        return "".join(chr(i) for i in data)
+
+    def read_card(self, known=None):
+        """Return (id, text) for the card in the field, or (None, None)
+
+        When the card's id is ``known`` only the UID is probed and text
+        is None; the block reads only happen for a new card.
+
+        The card is halted after every read and woken with WUPA, so it
+        answers each poll. With REQA it would skip every other one, as a
+        card left READY or ACTIVE by the previous poll ignores REQA.
+        """
+        uid = self._probe_uid()
+        if uid is None:
+            return None, None
+        tag_id = self.uid_to_num(uid)
+        text = None if tag_id == known else self._read_text(uid)
+        self.mfrc.MFRC522_Halt()
+        return tag_id, text
 
 class MusicBox:
+    # Volume moves in 5% steps (level 0-20); the status lines are built once
+    _VOLUME_LABELS = tuple(f"🔊 Volume: {level * 5}%" for level in range(21))
+
     def __init__(self):
-        self.reader = SimpleMFRC522()
+        self.pi = pigpio.pi()
+        if not self.pi.connected:
+            raise RuntimeError("pigpiod is not running (sudo systemctl start pigpiod)")
+        # Optional IRQ line: the reader thread sleeps until the chip raises it
+        rfid_irq = None
+        self.rfid_irq_cb = None
+        if RFID_IRQ_PIN is not None:
+            rfid_irq = threading.Event()
+            self.pi.set_mode(RFID_IRQ_PIN, pigpio.INPUT)
+            self.pi.set_pull_up_down(RFID_IRQ_PIN, pigpio.PUD_UP)
+            self.rfid_irq_cb = self.pi.callback(RFID_IRQ_PIN, pigpio.FALLING_EDGE, lambda *_: rfid_irq.set())
+        self.reader = RfidReader(irq=rfid_irq)
+        try:
+            speeds = (RFID_SPI_HZ, RFID_SPI_FALLBACK_HZ)
+            hz = self.reader.set_spi_speed(*speeds)
+            if hz not in speeds:
+                tried = " / ".join(f"{s / 1e6:g}" for s in speeds)
+                log.warning(f"⚠️ RFID reader garbled at {tried} MHz; staying at {hz / 1e6:g} MHz")
+            else:
+                log.info(f"✅ RFID SPI clock {hz / 1e6:g} MHz")
+        except AttributeError:
+            log.warning("⚠️ Could not raise RFID SPI clock; using the mfrc522 default")
         self.current_text = "Start"  # default label
         # Ensure attribute always exists even before first play
         self.current_text = self.current_text or ""
-        self.volume = 0.5  # Start at 50% volume
+        self.volume_level = 10  # Start at 50% volume
+        self.volume = self.volume_level / 20
+        self._last_vol_print = 0        # monotonic ns of the last volume line
+        self._logged_level = self.volume_level
+        self._vol_label_timer = None    # flushes the level a spin ended on
         self.is_paused = False
         self.is_playing = False
         self.running = True
@@ -114,172 +428,371 @@ class MusicBox:
         # Playback tracking
         self.current_track_path = None
         self.current_pos_sec = 0.0
-        self.last_status_update_time = time.time()
+        self._seek_base_sec = 0.0        # start= of the last play(); get_pos() counts from there
         self.seek_step_sec = 10  # seconds per detent when seeking
-        self.paused_uid = None  # track UID that caused a pause due to removal
+        self.paused_uid = None  # int UID that caused a pause due to removal
 
         # RFID presence debouncing (required for stable presence)
-        self.current_uid = None          # UID considered 'present'
-        self.uid_last_seen = 0.0         # last time we saw the current UID
-        self.remove_grace = 1.0          # seconds with no reads before 'removed'
+        self.current_uid = None          # int UID considered 'present'
+        self.remove_grace_ns = 150_000_000  # no reads this long before 'removed'
+        self.rfid_poll_sec = 0.05        # pause between reads on the RFID thread
+        # Cached and loaded audio is keyed by (path, mtime_ns, size) as of the
+        # last library scan, so a file replaced before a reload is re-read
+        self._music_cache = collections.OrderedDict()  # key -> encoded bytes, LRU first
+        self._music_cache_bytes = 0
+        self._music_caching = set()      # keys being read in by _read_for_cache
+        self._loaded_key = None          # key of the file in the music stream
+        self._rfid_thread = None
+        self._status_timer = None
 
         # NEW: RFID edge state to avoid replays / pause->restart bugs
         self.last_uid = None     # last seen RFID UID (or None if no card present)
         self.armed = True        # only trigger playback once per card-present cycle
+
+        # Encoder callbacks, the RFID thread and the signal handler post
+        # (kind, value) here; run() blocks on it and dispatches by kind
+        self.events = queue.SimpleQueue()
+        self.handlers = {
+            "rot": self.handle_rotation,   # net detents
+            "card_added": self.handle_card_added,      # (uid, text)
+            "card_removed": self.handle_card_removed,  # uid
+            "rescan": self.handle_rescan,  # SIGHUP: audio files changed
+            "status": self.handle_status,  # once a second while a track plays
+            "volume_label": self.handle_volume_label,  # rate-limited volume line due
+            "cached": self.handle_cached,  # (path, bytes or None) from _read_for_cache
+            # "btn" (simple taps) and "quit" (wake-up only) need no handler
+        }
         
-        # Initialize pygame mixer
+        # The mixer itself is opened on first playback (_ensure_mixer)
         try:
-            pygame.mixer.pre_init(frequency=22050, size=-16, channels=2, buffer=1024)
-            pygame.mixer.init()
-            pygame.mixer.music.set_volume(self.volume)
-            print("✅ Audio system initialized")
+            # pygame's event queue needs the video subsystem; a dummy driver
+            # is enough to receive the end-of-track event on a headless Pi
+            os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+            pygame.display.init()
+            pygame.event.set_blocked(None)
+            pygame.event.set_allowed(MUSIC_END)
             # Startup sound setup
             self.startup_channel = None
-            self.startup_sound_path = os.path.join(os.path.dirname(__file__), "startup.mp3")
+            self.startup_sound_path = os.path.join(_BASE_DIR, "startup.mp3")
         except Exception as e:
-            print(f"❌ Audio initialization failed: {e}")
+            log.error(f"❌ Audio initialization failed: {e}")
             raise
+
+        # Index the audio files once so a card tap is a dict lookup, not stats
+        self.library_dir = _BASE_DIR
+        self.refresh_library()
+        log.info(f"✅ Found {len(self.library)} tracks")
         
         # Set up rotary encoder
         try:
             self.encoder = RotaryEncoder(
+                self.pi,
+                self.events,
                 clk_pin=26,
                 dt_pin=16,
                 sw_pin=13
             )
-            print("✅ Rotary encoder initialized")
+            log.info("✅ Rotary encoder initialized")
         except Exception as e:
-            print(f"❌ Encoder initialization failed: {e}")
+            log.error(f"❌ Encoder initialization failed: {e}")
             raise
         
         # Signal handlers
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
+        signal.signal(signal.SIGHUP, self._rescan_handler)
         
-        print("\n🎵 RFID Musical Box with Volume Control Ready!")
+        log.info("🎵 RFID Musical Box with Volume Control Ready!")
 
         # Play startup sound non-blocking, if present
         self.play_startup_sound()
     
+    def _ensure_mixer(self):
+        """Open the audio device on first use; an open SDL mixer keeps its
+        callback thread running even while nothing plays"""
+        if pygame.mixer.get_init():
+            return
+        pygame.mixer.pre_init(frequency=44100, size=-16, channels=2, buffer=MIXER_BUFFER)
+        pygame.mixer.init()
+        pygame.mixer.music.set_volume(self.volume)
+        pygame.mixer.music.set_endevent(MUSIC_END)
+        atexit.register(pygame.mixer.quit)
+        log.info("✅ Audio system initialized")
+
     def _signal_handler(self, signum, frame):
-        print(f"\n🛑 Received signal {signum}, initiating graceful shutdown.")
+        log.info(f"🛑 Received signal {signum}, initiating graceful shutdown.")
         self.shutdown_requested = True
         self.running = False
+        # Wake run() if it is blocked on the queue (SimpleQueue.put is reentrant)
+        self.events.put(("quit", None))
     
-    def handle_volume_change(self, direction):
-        volume_step = 0.05
-        if direction > 0:
-            new_volume = min(1.0, self.volume + volume_step)
-        else:
-            new_volume = max(0.0, self.volume - volume_step)
-        if new_volume != self.volume:
-            self.volume = new_volume
-            pygame.mixer.music.set_volume(self.volume)
-            print(f"🔊 Volume: {int(self.volume*100)}%")
+    def _rescan_handler(self, signum, frame):
+        # Re-index on the main thread; the handler only queues the request
+        self.events.put(("rescan", None))
+
+    def handle_rescan(self, _value, now):
+        """Rebuild the track index after files were added or removed"""
+        self.refresh_library()
+        # Drop copies of files that changed; the next tap loads the new ones
+        for key in [k for k in self._music_cache if self._music_key(k[0]) != k]:
+            self._music_cache_bytes -= len(self._music_cache.pop(key))
+        log.info(f"✅ Found {len(self.library)} tracks")
+
+    def handle_volume_change(self, direction, now):
+        """Move the volume by ``direction`` 5% steps (a net detent count)"""
+        level = min(20, max(0, self.volume_level + direction))
+        if level != self.volume_level:
+            self.volume_level = level
+            self.volume = level / 20
+            if pygame.mixer.get_init():
+                pygame.mixer.music.set_volume(self.volume)
+            # At most 10 lines a second while the knob is spun; a level that
+            # lands inside the window is logged once it has passed, so the
+            # last line always shows where the spin stopped
+            if now - self._last_vol_print > 100_000_000:
+                self._log_volume(now)
+            elif self._vol_label_timer is None:
+                self._vol_label_timer = threading.Timer(0.1, self.events.put, (("volume_label", None),))
+                self._vol_label_timer.daemon = True
+                self._vol_label_timer.start()
+
+    def _log_volume(self, now):
+        self._last_vol_print = now
+        self._logged_level = self.volume_level
+        log.info(self._VOLUME_LABELS[self.volume_level])
+
+    def handle_volume_label(self, _value, now):
+        self._vol_label_timer = None
+        if self.volume_level != self._logged_level:
+            self._log_volume(now)
     
     def handle_pause_resume(self):
         if self.is_playing:
             if self.is_paused:
                 pygame.mixer.music.unpause()
                 self.is_paused = False
-                print("▶️  Music resumed")
+                log.info("▶️  Music resumed")
             else:
                 pygame.mixer.music.pause()
                 self.is_paused = True
-                print("⏸️  Music paused")
+                log.info("⏸️  Music paused")
         else:
-            print("❌ No music currently playing")
+            log.info("❌ No music currently playing")
     
+    def scan_library(self, base_dir):
+        """Map lower-cased track name -> audio path; .wav wins over .mp3"""
+        library = {}
+        for entry in os.scandir(base_dir or "."):
+            name, ext = os.path.splitext(entry.name)
+            ext = ext.lower()
+            if ext in ('.wav', '.mp3') and entry.is_file():
+                key = name.lower()
+                if ext == '.wav' or key not in library:
+                    library[key] = entry.path
+        return library
+
+    def build_play_table(self, library):
+        """Bind each track's path into a ready-to-call player"""
+        return {name: functools.partial(self._play_file, path) for name, path in library.items()}
+
+    def refresh_library(self):
+        self.library = self.scan_library(self.library_dir)
+        self.play_table = self.build_play_table(self.library)
+        stamps = {}
+        for path in self.library.values():
+            try:
+                st = os.stat(path)
+                stamps[path] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                pass
+        self.file_stamps = stamps
+
+    def _music_key(self, filepath):
+        return (filepath,) + self.file_stamps.get(filepath, (0, 0))
+
     def play_track(self, track_name, start_pos: float = 0.0):
-        try:
-            # Revert to hardcoded path
-            base_path = os.path.join(os.path.dirname(__file__), track_name)
-            for ext in ['.wav', '.mp3']:
-                filepath = base_path + ext
-                if os.path.exists(filepath):
-                    if pygame.mixer.music.get_busy():
-                        pygame.mixer.music.stop()
-                        time.sleep(0.1)
-                    pygame.mixer.music.load(filepath)
-                    pygame.mixer.music.set_volume(self.volume)
-                    # Fade out startup sound if still playing
-                    try:
-                        if getattr(self, "startup_channel", None) and self.startup_channel.get_busy():
-                            self.startup_channel.fadeout(300)
-                    except Exception:
-                        pass
-
-                    if start_pos and start_pos > 0:
-                        try:
-                            pygame.mixer.music.play(start=start_pos)
-                        except TypeError:
-                            pygame.mixer.music.play()
-                            pygame.mixer.music.set_pos(start_pos)
-                    else:
-                        pygame.mixer.music.play()
-                    self.is_playing = True
-                    self.is_paused = False
-                    self.current_track_path = filepath
-                    self.current_pos_sec = float(start_pos) if start_pos else 0.0
-                    self.last_status_update_time = time.time()
-                    print(f"🔊 Playing {track_name} (start={start_pos:.1f}s)")
-                    return True
-            print(f"❌ No audio file found for {track_name}")
+        key = track_name.lower()
+        play = self.play_table.get(key)
+        if play is None:
+            # Maybe copied over since startup: one directory read picks up
+            # every new file, rather than a stat per extension
+            self.refresh_library()
+            play = self.play_table.get(key)
+        if play is None:
+            log.error(f"❌ No audio file found for {track_name}")
             return False
+        return play(track_name, start_pos)
+
+    def _load_music(self, key):
+        """Load the file behind ``key`` into the music stream, from RAM if cached.
+
+        pygame closes the file object of the stream it replaces, so every
+        load gets its own BytesIO over the cached bytes.
+        """
+        filepath = key[0]
+        data = self._music_cache.get(key)
+        if data is None:
+            pygame.mixer.music.load(filepath)
+            if key not in self._music_caching:
+                self._music_caching.add(key)
+                threading.Thread(target=self._read_for_cache, args=(key,), daemon=True).start()
+            return
+        pygame.mixer.music.load(io.BytesIO(data), os.path.splitext(filepath)[1][1:])
+        self._music_cache.move_to_end(key)
+
+    def _read_for_cache(self, key):
+        """Read a track in off the main thread; run() files it via handle_cached"""
+        filepath = key[0]
+        data = None
+        try:
+            if os.path.getsize(filepath) <= MUSIC_CACHE_BYTES:
+                with open(filepath, "rb") as f:
+                    data = f.read()
+        except OSError as e:
+            log.warning(f"⚠️ Could not cache {filepath}: {e}")
+        self.events.put(("cached", (key, data)))
+
+    def handle_cached(self, entry, now):
+        """Add a read-in track to the LRU cache, dropping the oldest over budget"""
+        key, data = entry
+        self._music_caching.discard(key)
+        if data is None or key in self._music_cache or self._music_key(key[0]) != key:
+            return
+        self._music_cache[key] = data
+        self._music_cache_bytes += len(data)
+        while (len(self._music_cache) > MUSIC_CACHE_TRACKS
+               or self._music_cache_bytes > MUSIC_CACHE_BYTES):
+            _, old = self._music_cache.popitem(last=False)
+            self._music_cache_bytes -= len(old)
+
+    def _play_file(self, filepath, track_name, start_pos: float = 0.0):
+        try:
+            self._ensure_mixer()
+            # stop() is synchronous in SDL_mixer; load()/play() can follow at once
+            if pygame.mixer.music.get_busy():
+                pygame.mixer.music.stop()
+            # The music stream keeps its file open after stop(), so a reinsert
+            # of the same card can skip re-opening and re-probing the decoder,
+            # unless a library rescan found the file changed on disk
+            key = self._music_key(filepath)
+            if key != self._loaded_key:
+                self._loaded_key = None
+                self._load_music(key)
+                self._loaded_key = key
+            pygame.mixer.music.set_volume(self.volume)
+            # Fade out startup sound if still playing
+            try:
+                if getattr(self, "startup_channel", None) and self.startup_channel.get_busy():
+                    self.startup_channel.fadeout(300)
+            except Exception:
+                pass
+
+            if start_pos and start_pos > 0:
+                try:
+                    pygame.mixer.music.play(start=start_pos)
+                except TypeError:
+                    pygame.mixer.music.play()
+                    pygame.mixer.music.set_pos(start_pos)
+            else:
+                pygame.mixer.music.play()
+            self.is_playing = True
+            self.is_paused = False
+            self.current_track_path = filepath
+            self._seek_base_sec = float(start_pos) if start_pos else 0.0
+            self.current_pos_sec = self._seek_base_sec
+            log.info(f"🔊 Playing {track_name} (start={start_pos:.1f}s)")
+            return True
         except Exception as e:
-            print(f"❌ Error playing {track_name}: {e}")
+            log.error(f"❌ Error playing {track_name}: {e}")
             return False
     
-    def check_music_status(self):
-        now = time.time()
-        if self.is_playing and not self.is_paused and pygame.mixer.music.get_busy():
-            delta = now - self.last_status_update_time
-            if delta > 0:
-                self.current_pos_sec += delta
-        self.last_status_update_time = now
-        if self.is_playing and not self.is_paused and not pygame.mixer.music.get_busy():
-            print("🎵 Song finished")
+    def _position(self):
+        """Update current_pos_sec from SDL's play clock and return it.
+
+        get_pos() counts milliseconds actually played since play(), not
+        including paused time or the start offset, so no wall clock is
+        involved; it is -1 once the stream has stopped.
+        """
+        if self.is_playing:
+            played = pygame.mixer.music.get_pos()
+            if played >= 0:
+                self.current_pos_sec = self._seek_base_sec + played / 1000.0
+        return self.current_pos_sec
+
+    def check_music_status(self, now):
+        """Handle end-of-track events queued by SDL_mixer since the last wakeup"""
+        # stop() ahead of a new track or a seek posts one too; the song only
+        # really finished if nothing is playing now, and one look at the
+        # stream answers that for every event queued since the last wakeup
+        if (pygame.event.get(MUSIC_END) and self.is_playing and not self.is_paused
+                and not pygame.mixer.music.get_busy()):
+            # get_pos() is already -1 here; current_pos_sec holds the last
+            # status tick's sample, within a second of the end
+            log.info("🎵 Song finished")
             self.is_playing = False
     
+    def _arm_status_timer(self):
+        """Wake run() in a second so a track's end is picked up promptly.
+
+        SDL's end event lands on pygame's queue, which nothing blocks on;
+        the timer only runs while a track plays, so an idle box sleeps.
+        """
+        if self._status_timer is None:
+            self._status_timer = threading.Timer(1.0, self.events.put, (("status", None),))
+            self._status_timer.daemon = True
+            self._status_timer.start()
+
+    def handle_status(self, _value, now):
+        # check_music_status already ran for this wakeup; run() re-arms.
+        # Sample the position while get_pos() is still valid, so a seek
+        # after the track ends starts from near its end
+        self._status_timer = None
+        if self.is_playing and not self.is_paused:
+            self._position()
+
     def handle_seek(self, direction):
-        """Seek within the current track; press + rotate to scrub."""
+        """Seek within the current track; press + rotate to scrub.
+
+        ``direction`` is a net detent count, so a fast spin seeks further.
+        """
         if not self.current_track_path:
-            print("↔️  Seek ignored (no track loaded)")
+            log.info("↔️  Seek ignored (no track loaded)")
             return
-        step = self.seek_step_sec * (1 if direction > 0 else -1)
-        new_pos = max(0.0, self.current_pos_sec + step)
+        step = self.seek_step_sec * direction
+        new_pos = max(0.0, self._position() + step)
         was_playing = self.is_playing and not self.is_paused
         was_paused = self.is_paused
         try:
+            # current_track_path is still the loaded stream; play() re-seeks it
             pygame.mixer.music.stop()
-            pygame.mixer.music.load(self.current_track_path)
             pygame.mixer.music.set_volume(self.volume)
             try:
                 pygame.mixer.music.play(start=new_pos)
             except TypeError:
                 pygame.mixer.music.play()
                 pygame.mixer.music.set_pos(new_pos)
+            self._seek_base_sec = new_pos
             self.current_pos_sec = new_pos
-            self.last_status_update_time = time.time()
             if was_paused:
                 pygame.mixer.music.pause()
                 self.is_paused = True
                 self.is_playing = True
-                print(f"⏱️  Scrubbed to {new_pos:.1f}s (paused)")
+                log.info(f"⏱️  Scrubbed to {new_pos:.1f}s (paused)")
             elif was_playing:
                 self.is_playing = True
                 self.is_paused = False
-                print(f"⏩⏪ Seek to {new_pos:.1f}s")
+                log.info(f"⏩⏪ Seek to {new_pos:.1f}s")
             else:
                 self.is_playing = True
                 self.is_paused = False
-                print(f"▶️  Restarted at {new_pos:.1f}s after finish")
+                log.info(f"▶️  Restarted at {new_pos:.1f}s after finish")
         except Exception as e:
-            print(f"⚠️ Seek error: {e}")
+            log.warning(f"⚠️ Seek error: {e}")
 
     def play_startup_sound(self):
         try:
             if os.path.exists(self.startup_sound_path):
+                self._ensure_mixer()
                 snd = pygame.mixer.Sound(self.startup_sound_path)
                 snd.set_volume(self.volume)
                 self.startup_channel = snd.play()
@@ -287,101 +800,191 @@ class MusicBox:
                 # No startup sound file; skip silently
                 pass
         except Exception as e:
-            print(f"⚠️ Startup sound error: {e}")
+            log.warning(f"⚠️ Startup sound error: {e}")
+
+    def handle_event(self, kind, value, now):
+        """Dispatch one queued (kind, value) event to its registered handler"""
+        handler = self.handlers.get(kind)
+        if handler is not None:
+            handler(value, now)
+
+    def handle_rotation(self, direction, now):
+        """Net rotation: seek while the knob is held down, else volume"""
+        if not direction:
+            return
+        if self.encoder.is_pressed():
+            self.handle_seek(direction)
+        else:
+            self.handle_volume_change(direction, now)
+
+    def _coalesce_rotation(self, first):
+        """Add up already-queued rotations whose edges fall within 20 ms of the first.
+
+        The window is measured on pigpiod's edge ticks, so nothing waits for
+        more detents to arrive. Returns the net detent count and the event
+        that closed the window (or None), so a spin costs one mixer call.
+        """
+        net, start_tick = first
+        while True:
+            try:
+                kind, value = self.events.get(block=False)
+            except queue.Empty:
+                return net, None
+            if kind != "rot" or pigpio.tickDiff(start_tick, value[1]) > 20000:
+                return net, (kind, value)
+            net += value[0]
+
+    def _rfid_loop(self):
+        """Poll the reader off the main thread and post card edges
+
+        Posts ("card_added", (uid, text)) when a card shows up or replaces
+        another, and ("card_removed", uid) once it has gone unseen for the
+        grace period. While the same card stays on the reader only its UID
+        is probed.
+        """
+        known_uid = None
+        last_hit = 0
+        while self.running and not self.shutdown_requested:
+            try:
+                tag_id, text = self.reader.read_card(known_uid)
+            except Exception as e:
+                log.warning(f"⚠️ RFID read error: {e}")
+                tag_id = None
+            now = time.monotonic_ns()
+            if tag_id is not None:
+                last_hit = now
+                if tag_id != known_uid:
+                    known_uid = tag_id
+                    self.events.put(("card_added", (tag_id, text)))
+            elif known_uid is not None and now - last_hit > self.remove_grace_ns:
+                self.events.put(("card_removed", known_uid))
+                known_uid = None
+            time.sleep(self.rfid_poll_sec)
+
+    def handle_card_added(self, card, now):
+        """A card was placed on the reader, or replaced the one there"""
+        seen_uid, text = card
+        if self.current_uid is None:
+            # Rising edge: new card detected
+            self.current_uid = seen_uid
+            # Resume first if this is the same UID we paused on
+            if self.is_paused and self.current_track_path and self.paused_uid == seen_uid:
+                pygame.mixer.music.unpause()
+                self.is_paused = False
+                self.is_playing = True
+                log.info("▶️  Resumed after reinsert")
+                self.armed = False
+            else:
+                log.info(f"💳 Card added/changed: UID={seen_uid}")
+                track = _TRACK_RE.sub("", text)
+                if track:
+                    if self.play_track(track, start_pos=0.0):
+                        self.current_text = track
+                        self.paused_uid = None
+                self.armed = False
+        elif seen_uid != self.current_uid:
+            # Swapped without a gap long enough to count as a removal
+            self.current_uid = seen_uid
+            log.info(f"💳 Card added/changed: UID={seen_uid}")
+            track = _TRACK_RE.sub("", text)
+            if track:
+                if self.play_track(track, start_pos=0.0):
+                    self.current_text = track
+                    self.paused_uid = None
+                self.armed = False
+
+    def handle_card_removed(self, tag_id, now):
+        """The card has gone unread for the grace period"""
+        if self.current_uid is not None:
+            log.info("💳 Card removed")
+            self.armed = True
+            if self.is_playing and not self.is_paused:
+                self._position()
+                pygame.mixer.music.pause()
+                self.is_paused = True
+                # Remember last paused UID (so the same card resumes)
+                self.paused_uid = self.current_uid
+                log.info("⏸️  Paused on card removal")
+            self.current_uid = None
 
     def run(self):
+        self._rfid_thread = threading.Thread(target=self._rfid_loop, daemon=True)
+        self._rfid_thread.start()
         try:
-            rfid_check_time = 0
-            status_check_time = 0
             while self.running and not self.shutdown_requested:
-                current_time = time.time()
-
-                direction = self.encoder.check_rotation()
-                if direction != 0:
-                    if self.encoder.is_pressed():
-                        self.handle_seek(direction)
-                    else:
-                        self.handle_volume_change(direction)
-                # Ignore simple button taps for now
-                # if self.encoder.check_button(): pass
-                if current_time - status_check_time > 1.0:
-                    self.check_music_status()
-                    status_check_time = current_time
-                # RFID edge-triggered logic (debounced)
-                if current_time - rfid_check_time > 0.5:
-                    try:
-                        tag_id, text = self.reader.read_no_block()
-                        seen_uid = str(tag_id) if tag_id is not None else None
-                        if seen_uid is not None:
-                            if self.current_uid is None:
-                                # Rising edge: new card detected
-                                self.current_uid = str(seen_uid)
-                                self.uid_last_seen = current_time
-                                # Resume first if this is the same UID we paused on
-                                if self.is_paused and self.current_track_path and str(self.paused_uid) == str(seen_uid):
-                                    pygame.mixer.music.unpause()
-                                    self.is_paused = False
-                                    self.is_playing = True
-                                    self.last_status_update_time = time.time()
-                                    print("▶️  Resumed after reinsert")
-                                    self.armed = False
-                                else:
-                                    print(f"\n💳 Card added/changed: UID={seen_uid}")
-                                    if text:
-                                        text = text.strip()
-                                    track = re.sub(r"[^A-Za-z0-9_-]", "", text or "") if text else ""
-                                    if track:
-                                        if self.play_track(track, start_pos=0.0):
-                                            self.current_text = text
-                                            self.paused_uid = None
-                                    self.armed = False
-                            else:
-                                # Card still present; check if changed UID
-                                self.uid_last_seen = current_time
-                                if str(seen_uid) != str(self.current_uid):
-                                    self.current_uid = str(seen_uid)
-                                    print(f"\n💳 Card added/changed: UID={seen_uid}")
-                                    if text:
-                                        text = text.strip()
-                                    track = re.sub(r"[^A-Za-z0-9_-]", "", text or "") if text else ""
-                                    if track:
-                                        if self.play_track(track, start_pos=0.0):
-                                            self.current_text = text
-                                            self.paused_uid = None
-                                        self.armed = False
-                        else:
-                            # No UID this poll; only consider removal after grace period
-                            if self.current_uid is not None and (current_time - self.uid_last_seen) > self.remove_grace:
-                                print("💳 Card removed")
-                                self.armed = True
-                                if self.is_playing and not self.is_paused:
-                                    pygame.mixer.music.pause()
-                                    self.is_paused = True
-                                    # Remember last paused UID (so the same card resumes)
-                                    self.paused_uid = str(self.current_uid)
-                                    print("⏸️  Paused on card removal")
-                                self.current_uid = None
-                        rfid_check_time = current_time
-                    except Exception as e:
-                        print(f"⚠️ RFID read error: {e}")
-                        rfid_check_time = current_time
-                time.sleep(0.01)
+                # Sleep until an encoder / RFID / signal event arrives
+                event = self.events.get()
+
+                # One clock read per wakeup, shared by everything below.
+                # Song-end events are picked up first so handlers see
+                # an up to date is_playing
+                now = time.monotonic_ns()
+                self.check_music_status(now)
+                while event is not None:
+                    kind, value = event
+                    event = None
+                    if kind == "rot":
+                        value, event = self._coalesce_rotation(value)
+                    self.handle_event(kind, value, now)
+                if self.is_playing and not self.is_paused:
+                    self._arm_status_timer()
         finally:
             self.cleanup()
-    
+
     def cleanup(self):
-        print("🧹 Cleanup starting.")
+        log.info("🧹 Cleanup starting.")
+        self.running = False
+        try:
+            if self._status_timer is not None:
+                self._status_timer.cancel()
+            if self._vol_label_timer is not None:
+                self._vol_label_timer.cancel()
+            # Let an in-flight SPI read finish before the GPIO is released
+            if self._rfid_thread is not None:
+                self._rfid_thread.join(timeout=1.0)
+        except: pass
         try:
             if pygame.mixer.get_init():
                 pygame.mixer.music.stop()
                 pygame.mixer.quit()
         except: pass
+        try:
+            self.encoder.cleanup()
+            if self.rfid_irq_cb is not None:
+                self.rfid_irq_cb.cancel()
+        except: pass
+        try:
+            self.pi.stop()
+        except: pass
         try:
             GPIO.cleanup()
         except: pass
-        print("✅ Cleanup complete")
+        log.info("✅ Cleanup complete")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="RFID musical box")
+    parser.add_argument("-v", "--verbose", action="store_true", default=DEBUG,
+                        help="also log every rotation, button press and pin state")
+    return parser.parse_args(argv)
+
+def setup_logging(verbose=False):
+    level = logging.DEBUG if verbose else logging.INFO
+    console = logging.StreamHandler(sys.stdout)
+    console.setLevel(logging.WARNING)
+    handlers = [console]
+    try:
+        logfile = logging.handlers.RotatingFileHandler(LOG_PATH, maxBytes=64 * 1024, backupCount=2)
+        logfile.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        handlers.append(logfile)
+    except OSError:
+        # No writable log dir (e.g. started by hand): keep everything on stdout
+        console.setLevel(level)
+    logging.basicConfig(level=level, format="%(message)s", handlers=handlers)
+    log.setLevel(level)
 
 def main():
+    args = parse_args()
+    setup_logging(args.verbose)
     GPIO.setwarnings(False)
     GPIO.setmode(GPIO.BCM)
     musicbox = MusicBox()